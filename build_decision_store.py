@@ -0,0 +1,53 @@
+"""Construit le store SQLite consolidé des décisions (decisions.db).
+
+Des milliers de petits fichiers JSON coûtent un open() + lookup inode par
+décision ; les regrouper dans une base SQLite unique ramène la lecture à une
+requête sur un fichier mmap'é. À lancer une fois après mise à jour du dossier
+decisions/ ; l'application retombe sur les fichiers JSON si la base est
+absente.
+
+Usage : python build_decision_store.py
+"""
+
+import pickle
+import sqlite3
+from pathlib import Path
+
+import orjson
+import zstandard as zstd
+
+PICKLE_INDEX_PATH = "decision_index.pkl.zst"
+DECISIONS_DIR = Path("decisions")
+DB_PATH = "decisions.db"
+
+
+def main():
+    dctx = zstd.ZstdDecompressor()
+    with open(PICKLE_INDEX_PATH, "rb") as f:
+        index = pickle.loads(dctx.decompress(f.read()))
+
+    con = sqlite3.connect(DB_PATH)
+    con.execute("CREATE TABLE IF NOT EXISTS decisions (k TEXT PRIMARY KEY, text TEXT)")
+
+    inserted = missing = 0
+    for decision_id, path in index.items():
+        path_obj = DECISIONS_DIR / Path(path).name
+        try:
+            with open(path_obj, "rb") as f:
+                text = orjson.loads(f.read()).get("text", "")
+        except OSError:
+            missing += 1
+            continue
+        con.execute(
+            "INSERT OR REPLACE INTO decisions VALUES (?, ?)",
+            (decision_id, text),
+        )
+        inserted += 1
+
+    con.commit()
+    con.close()
+    print(f"{inserted} décisions insérées dans {DB_PATH} ({missing} fichiers absents).")
+
+
+if __name__ == "__main__":
+    main()